@@ -6,13 +6,19 @@ ACTION = 'action'
 GITHUB_ACTOR = 'GITHUB_ACTOR'
 GITHUB_ACTION = 'GITHUB_ACTION'
 GITHUB_ACTIONS = 'GITHUB_ACTIONS'
+GITHUB_API_URL = 'GITHUB_API_URL'
+GITHUB_ENV = 'GITHUB_ENV'
 GITHUB_EVENT_NAME = 'GITHUB_EVENT_NAME'
 GITHUB_EVENT_PATH = 'GITHUB_EVENT_PATH'
+GITHUB_GRAPHQL_URL = 'GITHUB_GRAPHQL_URL'
 GITHUB_BASE_REF = 'GITHUB_BASE_REF'
 GITHUB_HEAD_REF = 'GITHUB_HEAD_REF'
+GITHUB_OUTPUT = 'GITHUB_OUTPUT'
 GITHUB_REF = 'GITHUB_REF'
 GITHUB_REPOSITORY = 'GITHUB_REPOSITORY'
+GITHUB_RUN_ID = 'GITHUB_RUN_ID'
 GITHUB_SHA = 'GITHUB_SHA'
+GITHUB_STEP_SUMMARY = 'GITHUB_STEP_SUMMARY'
 GITHUB_TOKEN = 'GITHUB_TOKEN'
 GITHUB_WORKFLOW = 'GITHUB_WORKFLOW'
 GITHUB_WORKSPACE = 'GITHUB_WORKSPACE'
@@ -1,7 +1,42 @@
-from github import Github
+import datetime
+import math
+import os
+import threading
+import uuid
 
+try:
+    from queue import Empty, Queue
+except ImportError:
+    from Queue import Empty, Queue  # Python 2
+
+from github import Github, GithubException
+from github.Consts import DEFAULT_BASE_URL, DEFAULT_PER_PAGE
+
+from actions.constants import GITHUB_API_URL, GITHUB_GRAPHQL_URL
 from actions.event import get_event_data
-from actions.utils import get_github_token
+from actions.policy import DEFAULT_REQUEST_POLICY, BudgetExhaustedError, RateLimitBudget, start_call
+from actions.utils import get_github_token, run_workers
+
+# margin (in seconds) for clock skew when checking whether a comment was already posted
+COMMENT_SINCE_MARGIN = 60
+
+# hidden marker included in posted comments, to recognise them when checking whether they were already posted
+IDEMPOTENCY_MARKER = '<!-- idempotency:%s -->'
+
+# ways to clean up stale comments
+CLEANUP_DELETE = 'delete'
+CLEANUP_MINIMIZE = 'minimize'
+
+# number of API requests to keep in reserve when the number of requests is limited by the rate limit
+RATE_LIMIT_RESERVE = 100
+
+MINIMIZE_COMMENT_MUTATION = """
+mutation($id: ID!) {
+  minimizeComment(input: {subjectId: $id, classifier: OUTDATED}) {
+    minimizedComment { isMinimized }
+  }
+}
+"""
 
 
 def issue_or_pr_context():
@@ -16,10 +51,42 @@ def pr_context():
     return 'pull_request' in event_data or 'pull_request' in event_data.get('issue', {})
 
 
-def _get_repo():
+def _get_github(policy=None):
+    """Get GitHub client, configured according to specified request policy."""
+    if policy is None:
+        policy = DEFAULT_REQUEST_POLICY
+
+    base_url = os.getenv(GITHUB_API_URL, DEFAULT_BASE_URL)
+    # client expects timeout as an integer number of seconds
+    timeout = int(math.ceil(policy.attempt_timeout))
+
+    return Github(get_github_token(), base_url=base_url, timeout=timeout)
+
+
+def _get_authenticated_login(gh, policy):
+    """
+    Get login of authenticated user, or None if it can not be determined
+    (a GitHub Actions token is not allowed to query the authenticated user).
+    """
+    def get_login():
+        return gh.get_user().login
+
+    try:
+        res = policy.read(get_login)
+    except GithubException as err:
+        if err.status != 403:
+            raise
+        res = None
+
+    return res
+
+
+def _get_repo(policy=None, gh=None):
     """Get repository that triggered current workflow."""
+    if gh is None:
+        gh = _get_github(policy=policy)
+
     event_data = get_event_data()
-    gh = Github(get_github_token())
     repo = gh.get_repo(event_data['repository']['full_name'])
 
     return repo
@@ -36,57 +103,89 @@ def _get_event_data_key_from_issue_or_pr(key):
     return res
 
 
-def _get_issue(repo=None):
+def _get_issue(repo=None, policy=None):
     """Get issue that triggered current workflow."""
     if not issue_or_pr_context():
         raise RuntimeError("Current workflow was not triggered by an issue or pull request!")
 
     if repo is None:
-        repo = _get_repo()
+        repo = _get_repo(policy=policy)
 
     issue_id = _get_event_data_key_from_issue_or_pr('number')
     return repo.get_issue(issue_id)
 
 
-def _get_pr(repo=None):
+def _get_pr(repo=None, policy=None):
     """Get pull request that triggered current workflow."""
     if not pr_context():
         raise RuntimeError("Current workflow was not triggered by a pull request!")
 
     if repo is None:
-        repo = _get_repo()
+        repo = _get_repo(policy=policy)
 
     pr_id = _get_event_data_key_from_issue_or_pr('number')
     return repo.get_pull(pr_id)
 
 
-def get_issue_comments():
-    """Get comments for issue (or pull request) that triggered current workflow."""
-    issue = _get_issue()
+def _iter_pages(paginated, policy):
+    """
+    Generator that yields items of specified paginated list, requesting one page at a time using specified policy,
+    so the attempt timeout applies to each page rather than to the whole list.
+    """
+    page = 0
+    while True:
+        items = policy.read(paginated.get_page, page)
+        for item in items:
+            yield item
+
+        # client is created with default number of items per page, so a shorter page is the last one
+        if len(items) < DEFAULT_PER_PAGE:
+            break
+        page += 1
 
-    comments = issue.get_comments()
 
-    return [c.body for c in comments]
+def get_issue_comments(policy=None):
+    """
+    Get comments for issue (or pull request) that triggered current workflow.
 
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None)
+    """
+    policy = start_call(policy)
 
-def get_pr_review_comments():
-    """Get pull request review comments for PR that triggered current workflow."""
-    pr = _get_pr()
+    issue = policy.read(_get_issue, policy=policy)
 
-    comments = pr.get_comments()
+    return [c.body for c in _iter_pages(issue.get_comments(), policy)]
 
-    return [c.body for c in comments]
 
+def get_pr_review_comments(policy=None):
+    """
+    Get pull request review comments for PR that triggered current workflow.
 
-def get_pr_status():
-    """Get (combined) status of pull request that triggered current workflow."""
-    repo = _get_repo()
-    pr = _get_pr(repo=repo)
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None)
+    """
+    policy = start_call(policy)
 
-    last_pr_commit = repo.get_commit(pr.head.sha)
-    status = last_pr_commit.get_combined_status().state
+    pr = policy.read(_get_pr, policy=policy)
 
-    return status
+    return [c.body for c in _iter_pages(pr.get_comments(), policy)]
+
+
+def get_pr_status(policy=None):
+    """
+    Get (combined) status of pull request that triggered current workflow.
+
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None)
+    """
+    policy = start_call(policy)
+
+    def get_status():
+        repo = _get_repo(policy=policy)
+        pr = _get_pr(repo=repo)
+
+        last_pr_commit = repo.get_commit(pr.head.sha)
+        return last_pr_commit.get_combined_status().state
+
+    return policy.read(get_status)
 
 
 def get_label_names():
@@ -113,8 +212,19 @@ def get_milestone_title():
     return res
 
 
-def post_comment(txt):
-    """Post comment in issue (or pull request) that triggered current workflow."""
+def post_comment(txt, policy=None):
+    """
+    Post comment in issue (or pull request) that triggered current workflow.
+
+    A hidden marker with a unique key is added to the comment. If posting the comment fails,
+    it is only retried if no comment with that marker was posted (by the authenticated user) after all,
+    so the comment is never posted more than once.
+
+    :param txt: comment body (may include templates like %(comment_body)s and %(sender_login)s)
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None)
+    """
+    policy = start_call(policy)
+
     event_data = get_event_data()
 
     templates = {}
@@ -129,6 +239,238 @@ def post_comment(txt):
     except KeyError as err:
         raise KeyError("One or more unknown templates used in comment body: %s" % err)
 
+    marker = IDEMPOTENCY_MARKER % uuid.uuid4()
+    body = templated_txt + '\n\n' + marker
+
     # post comment in issue that triggered current workflow
-    issue = _get_issue()
-    return issue.create_comment(templated_txt)
+    gh = _get_github(policy=policy)
+    repo = policy.read(_get_repo, gh=gh)
+    issue = policy.read(_get_issue, repo=repo)
+
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=COMMENT_SINCE_MARGIN)
+
+    def find_posted_comment():
+        """Find comment that was posted by a failed attempt after all (if any)."""
+        login = _get_authenticated_login(gh, policy)
+        for comment in _iter_pages(issue.get_comments(since=since), policy):
+            if marker in comment.body and (login is None or comment.user.login == login):
+                return comment
+        return None
+
+    return policy.write(issue.create_comment, body, find_existing=find_posted_comment)
+
+
+def _select_stale_comments(comments, authors=None, marker=None, older_than=None):
+    """
+    Generator that yields stale comments from specified comments,
+    i.e. comments that match all specified criteria (author, marker in body, age).
+    """
+    if older_than is not None:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than)
+
+    for comment in comments:
+        if authors is not None and comment.user.login not in authors:
+            continue
+        if marker is not None and marker not in comment.body:
+            continue
+        if older_than is not None:
+            created_at = comment.created_at
+            if created_at.utcoffset() is not None:
+                created_at = created_at.replace(tzinfo=None) - created_at.utcoffset()
+            if created_at > cutoff:
+                continue
+
+        yield comment
+
+
+def _minimize_comment(requester, comment, retry=False):
+    """
+    Minimize specified comment as outdated (via GraphQL API), using specified requester.
+
+    :param comment: dict with ID, node ID and URL of comment
+    :param retry: whether a previous attempt to minimize this comment failed
+    """
+    graphql_url = os.getenv(GITHUB_GRAPHQL_URL, os.getenv(GITHUB_API_URL, DEFAULT_BASE_URL) + '/graphql')
+    query = {
+        'query': MINIMIZE_COMMENT_MUTATION,
+        'variables': {'id': comment['node_id']},
+    }
+    _, data = requester.requestJsonAndCheck('POST', graphql_url, input=query)
+    if data.get('errors'):
+        raise RuntimeError("Failed to minimize comment %s: %s" % (comment['id'], data['errors']))
+
+
+def _delete_comment(requester, comment, retry=False):
+    """
+    Delete specified comment, using specified requester.
+
+    :param comment: dict with ID, node ID and URL of comment
+    :param retry: whether a previous attempt to delete this comment failed
+    """
+    try:
+        requester.requestJsonAndCheck('DELETE', comment['url'])
+    except GithubException as err:
+        # on a retry, the comment may have been deleted already by the failed attempt (if its response was lost);
+        # otherwise, the comment was not deleted by this cleanup
+        if err.status != 404 or not retry:
+            raise
+
+
+def _load_cleanup_state(state_path):
+    """Load IDs of comments that were already cleaned up from specified state file (if any)."""
+    processed_ids = set()
+    if state_path is not None and os.path.exists(state_path):
+        with open(state_path) as fp:
+            processed_ids = set(int(line) for line in fp if line.strip())
+
+    return processed_ids
+
+
+class _CleanupRecorder(object):
+    """Thread-safe recorder of results of cleaning up comments, in report and state file (if any)."""
+
+    def __init__(self, report, state_path=None):
+        self.report = report
+        self._lock = threading.Lock()
+        self._state_fp = None if state_path is None else open(state_path, 'a')
+
+    def record(self, key, comment_id, error=None):
+        """Record result for comment with specified ID (key is 'processed', 'skipped' or 'failed')."""
+        with self._lock:
+            if key == 'failed':
+                self.report['failed'][comment_id] = error
+            else:
+                self.report[key].append(comment_id)
+
+            if key == 'processed' and self._state_fp is not None:
+                self._state_fp.write('%d\n' % comment_id)
+                self._state_fp.flush()
+
+    def close(self):
+        """Close state file (if any), and sort lists of comment IDs in report."""
+        if self._state_fp is not None:
+            self._state_fp.close()
+        for key in ['processed', 'skipped']:
+            self.report[key].sort()
+
+
+def _process_comment_within_budget(requester, comment, process, budget, attempts):
+    """
+    Process specified comment via specified function, if the budget of API requests allows it.
+
+    :param attempts: dict that tracks the number of attempts to process this comment (updated in place)
+    """
+    if not budget.acquire():
+        raise BudgetExhaustedError("Budget of API requests is exhausted")
+
+    retry = attempts['count'] > 0
+    attempts['count'] += 1
+    process(requester, comment, retry=retry)
+
+
+def _cleanup_worker(tasks, process, budget, policy, recorder):
+    """Worker that cleans up comments from specified queue, until it is empty."""
+    # each worker uses its own client, since a client can not be shared safely between threads
+    repo_name = get_event_data()['repository']['full_name']
+    requester = _get_github(policy=policy).get_repo(repo_name, lazy=True)._requester
+
+    while True:
+        try:
+            comment = tasks.get_nowait()
+        except Empty:
+            return
+
+        try:
+            # budget is checked in every attempt, so retries are also charged to it
+            policy.write(_process_comment_within_budget, requester, comment, process, budget, {'count': 0})
+        except BudgetExhaustedError:
+            recorder.record('skipped', comment['id'])
+        except Exception as err:
+            recorder.record('failed', comment['id'], error=str(err))
+        else:
+            recorder.record('processed', comment['id'])
+
+
+def _run_cleanup_workers(comments, process, budget, policy, report, state_path=None, workers=4):
+    """
+    Clean up specified comments via specified function, using a pool of concurrent workers
+    that share specified budget of API requests. Results are added to specified report.
+
+    :param state_path: path to file to record IDs of cleaned up comments in (if any)
+    """
+    tasks = Queue()
+    for comment in comments:
+        # only pass what is needed to process comment, since comment objects are bound to a client;
+        # raw data is used since accessing comment.raw_data triggers an extra request
+        tasks.put(dict((key, comment._rawData[key]) for key in ['id', 'node_id', 'url']))
+
+    recorder = _CleanupRecorder(report, state_path=state_path)
+    try:
+        run_workers(_cleanup_worker, workers, tasks, process, budget, policy, recorder)
+    finally:
+        recorder.close()
+
+
+def clean_up_comments(authors=None, marker=None, older_than=None, action=CLEANUP_MINIMIZE, dry_run=False,
+                      state_path=None, workers=4, budget=None, policy=None):
+    """
+    Clean up stale comments in issue (or pull request) that triggered current workflow.
+
+    Comments are streamed page by page, and only the ones matching all specified criteria are retained.
+    These are then minimized (as outdated) or deleted by a pool of concurrent workers,
+    which share a budget of API requests. Selection is done before acting on comments,
+    since deleting comments while paging through them would shift pages and skip comments.
+
+    :param authors: list of logins of authors of stale comments
+    :param marker: string that is included in body of stale comments
+    :param older_than: minimal age (in seconds) of stale comments
+    :param action: how to clean up stale comments (CLEANUP_MINIMIZE or CLEANUP_DELETE)
+    :param dry_run: only report which comments would be cleaned up
+    :param state_path: path to file to record cleaned up comments in, used to resume an interrupted cleanup
+    :param workers: number of concurrent workers
+    :param budget: RateLimitBudget to share among workers (if None, remaining rate limit minus a reserve is used)
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None)
+    :return: dict with lists of IDs of selected comments, and of comments that were processed, resumed
+             (already processed according to state file), or skipped (because budget was exhausted),
+             as well as dict with error messages for comments that could not be processed;
+             for a dry run, comments that would be processed are listed under 'would_process' instead
+    """
+    if authors is None and marker is None and older_than is None:
+        raise ValueError("At least one criterion for stale comments must be specified!")
+
+    if action == CLEANUP_MINIMIZE:
+        process = _minimize_comment
+    elif action == CLEANUP_DELETE:
+        process = _delete_comment
+    else:
+        raise ValueError("Unknown way to clean up comments: %s" % action)
+
+    policy = start_call(policy)
+
+    gh = _get_github(policy=policy)
+    repo = policy.read(_get_repo, gh=gh)
+    issue = policy.read(_get_issue, repo=repo)
+
+    comments = _iter_pages(issue.get_comments(), policy)
+    stale_comments = list(_select_stale_comments(comments, authors=authors, marker=marker, older_than=older_than))
+
+    report = {
+        'selected': [c.id for c in stale_comments],
+        'processed': [],
+        'resumed': [],
+        'skipped': [],
+        'failed': {},
+    }
+
+    processed_ids = _load_cleanup_state(state_path)
+    report['resumed'] = [c.id for c in stale_comments if c.id in processed_ids]
+    todo = [c for c in stale_comments if c.id not in processed_ids]
+
+    if dry_run:
+        report['would_process'] = [c.id for c in todo]
+    elif todo:
+        if budget is None:
+            budget = RateLimitBudget(gh.rate_limiting[0] - RATE_LIMIT_RESERVE)
+        _run_cleanup_workers(todo, process, budget, policy, report, state_path=state_path, workers=workers)
+
+    return report
@@ -0,0 +1,237 @@
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+
+import requests
+from github import GithubException
+from github.Consts import DEFAULT_BASE_URL
+
+from actions.constants import GITHUB_API_URL, GITHUB_RUN_ID
+from actions.event import get_event_data
+from actions.policy import start_call
+from actions.utils import get_env_var, get_github_token
+
+# size of chunks (in bytes) in which logs are downloaded
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# flags of regular expressions that can be applied to part of a pattern, via '(?<flags>:...)'
+SCOPED_FLAGS = [
+    (getattr(re, 'ASCII', 0), 'a'),  # re.ASCII is not available in Python 2
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+]
+
+# global inline flags, like '(?i)'
+GLOBAL_INLINE_FLAGS_REGEX = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+def _download_run_logs(url, path, timeout):
+    """Download (zipped) workflow run logs from specified URL to file at specified path, in chunks."""
+    headers = {'Authorization': 'token %s' % get_github_token()}
+    # logs are served via a redirect to a signed URL, Authorization header is dropped when following it
+    resp = requests.get(url, headers=headers, stream=True, timeout=timeout)
+    try:
+        if resp.status_code >= 400:
+            raise GithubException(resp.status_code, {'message': resp.reason}, resp.headers)
+
+        # file is (re)written from scratch by every attempt
+        with open(path, 'wb') as fp:
+            for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                fp.write(chunk)
+    finally:
+        resp.close()
+
+
+def _get_log_context(name):
+    """
+    Determine job name, step number and step name for log file with specified name in zipped workflow run logs.
+
+    Logs for steps are in '<job name>/<step number>_<step name>.txt', full job logs in '<n>_<job name>.txt'.
+    """
+    job, _, filename = name.rpartition('/')
+    number, _, step = os.path.splitext(filename)[0].partition('_')
+
+    if not number.isdigit():
+        number, step = None, os.path.splitext(filename)[0]
+
+    if job:
+        res = (job, None if number is None else int(number), step)
+    else:
+        res = (step, None, None)
+
+    return res
+
+
+def _select_log_files(zip_file):
+    """
+    Select log files to scan in zipped workflow run logs:
+    logs for all steps, and full job logs only for jobs without logs for steps (to avoid duplicate matches).
+    """
+    step_logs, job_logs = [], []
+    for info in zip_file.infolist():
+        if info.filename.endswith('/'):
+            continue
+        if '/' in info.filename:
+            step_logs.append(info)
+        else:
+            job_logs.append(info)
+
+    jobs_with_step_logs = set(_get_log_context(info.filename)[0] for info in step_logs)
+
+    return step_logs + [info for info in job_logs if _get_log_context(info.filename)[0] not in jobs_with_step_logs]
+
+
+def _scan_log_file(zip_file, info, matcher, patterns):
+    """
+    Scan specified log file in zipped workflow run logs, which is decompressed incrementally.
+
+    Lines are first checked with the combined matcher for all patterns (if any),
+    only lines that match are checked against every pattern individually.
+    """
+    job, step_number, step = _get_log_context(info.filename)
+
+    matches = []
+    with zip_file.open(info) as raw_fp:
+        fp = io.TextIOWrapper(raw_fp, encoding='utf-8-sig', errors='replace')
+        for line_number, line in enumerate(fp, 1):
+            if matcher is None or matcher.search(line):
+                for name, regex in patterns:
+                    if regex.search(line):
+                        matches.append({
+                            'job': job,
+                            'step_number': step_number,
+                            'step': step,
+                            'line_number': line_number,
+                            'line': line.rstrip('\r\n'),
+                            'pattern': name,
+                        })
+
+    return matches
+
+
+def _compile_matcher(regexes):
+    """
+    Compile combined matcher for specified regular expressions, which is used to pre-filter lines.
+
+    Every pattern is combined with its own flags; None is returned if the patterns can not be combined safely,
+    in which case lines must be checked against every pattern individually.
+    """
+    parts = []
+    for regex in regexes:
+        # capturing groups can not be combined safely (group names clash, numbered backreferences shift)
+        if regex.groups:
+            return None
+
+        # flags set via global inline flags at the start are included in regex.flags,
+        # and are applied to this part only; elsewhere they would apply to the combined pattern (Python < 3.11)
+        pattern = regex.pattern
+        match = GLOBAL_INLINE_FLAGS_REGEX.match(pattern)
+        if match:
+            pattern = pattern[match.end():]
+        if GLOBAL_INLINE_FLAGS_REGEX.search(pattern):
+            return None
+
+        flags = ''.join(letter for flag, letter in SCOPED_FLAGS if regex.flags & flag)
+        if 'x' in flags:
+            # a trailing comment in a verbose pattern would also comment out the closing parenthesis
+            pattern += '\n'
+        parts.append('(?%s:%s)' % (flags, pattern))
+
+    try:
+        res = re.compile('|'.join(parts))
+    except re.error:
+        # for example when flags can not be applied to part of a pattern (Python < 3.7)
+        res = None
+
+    return res
+
+
+# state of worker process that scans log files, set by _init_scan_worker
+_SCAN_WORKER_STATE = {}
+
+
+def _init_scan_worker(zip_path, matcher, patterns):
+    """Initialize worker process that scans log files: open zipped logs, and store matcher & patterns."""
+    # each worker process uses its own handle to the zipped logs, which is closed when the process exits
+    _SCAN_WORKER_STATE['zip_file'] = zipfile.ZipFile(zip_path)
+    _SCAN_WORKER_STATE['matcher'] = matcher
+    _SCAN_WORKER_STATE['patterns'] = patterns
+
+
+def _scan_worker(filename):
+    """Scan log file with specified name in zipped logs, in worker process that was initialized before."""
+    zip_file = _SCAN_WORKER_STATE['zip_file']
+    return _scan_log_file(zip_file, zip_file.getinfo(filename), _SCAN_WORKER_STATE['matcher'],
+                          _SCAN_WORKER_STATE['patterns'])
+
+
+def _scan_log_files(zip_path, filenames, matcher, patterns, workers):
+    """
+    Scan log files with specified names in zipped logs at specified path, using a pool of worker processes
+    (scanning is CPU-bound, so threads would not scan log files in parallel).
+    """
+    if workers == 1 or len(filenames) <= 1:
+        with zipfile.ZipFile(zip_path) as zip_file:
+            results = [_scan_log_file(zip_file, zip_file.getinfo(f), matcher, patterns) for f in filenames]
+    else:
+        pool = multiprocessing.Pool(min(workers, len(filenames)), initializer=_init_scan_worker,
+                                    initargs=(zip_path, matcher, patterns))
+        try:
+            results = pool.map(_scan_worker, filenames)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    return [match for matches in results for match in matches]
+
+
+def search_run_logs(patterns, run_id=None, workers=4, policy=None):
+    """
+    Search logs of workflow run for specified patterns.
+
+    The zipped logs are streamed to a temporary file, and log files are decompressed and scanned
+    incrementally (line by line) by a pool of worker processes, so logs are never fully loaded into memory.
+
+    :param patterns: list of regular expressions (strings or compiled) to search for,
+                     or dict with names for regular expressions
+    :param run_id: ID of workflow run (if None, current workflow run is used, via $GITHUB_RUN_ID)
+    :param workers: number of worker processes to scan log files (1 implies scanning in current process)
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None)
+    :return: list of matches, as dicts with job, step number & name, line number, line and (name of) pattern
+    """
+    policy = start_call(policy)
+
+    if not isinstance(patterns, dict):
+        patterns = dict((getattr(pattern, 'pattern', pattern), pattern) for pattern in patterns)
+    if not patterns:
+        raise ValueError("At least one pattern to search for must be specified!")
+
+    patterns = [(name, re.compile(patterns[name])) for name in sorted(patterns)]
+    matcher = _compile_matcher(regex for _, regex in patterns)
+
+    if run_id is None:
+        run_id = get_env_var(GITHUB_RUN_ID)
+
+    event_data = get_event_data()
+    base_url = os.getenv(GITHUB_API_URL, DEFAULT_BASE_URL)
+    url = '%s/repos/%s/actions/runs/%s/logs' % (base_url, event_data['repository']['full_name'], run_id)
+
+    # temporary file is closed before it is (re)opened, which is required on Windows
+    fd, zip_path = tempfile.mkstemp(suffix='.zip')
+    os.close(fd)
+    try:
+        policy.stream(_download_run_logs, url, zip_path, policy.attempt_timeout)
+
+        with zipfile.ZipFile(zip_path) as zip_file:
+            filenames = [info.filename for info in _select_log_files(zip_file)]
+
+        matches = _scan_log_files(zip_path, filenames, matcher, patterns, workers)
+    finally:
+        os.remove(zip_path)
+
+    return sorted(matches, key=lambda m: (m['job'], m['step_number'] or 0, m['line_number'], m['pattern']))
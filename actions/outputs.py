@@ -0,0 +1,134 @@
+import atexit
+import json
+import os
+import threading
+import uuid
+
+from actions.constants import GITHUB_ENV, GITHUB_OUTPUT, GITHUB_STEP_SUMMARY
+from actions.utils import get_env_var
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str  # Python 3
+
+
+class _BufferedFile(object):
+    """
+    Buffer for file that is specified via an environment variable (like $GITHUB_OUTPUT),
+    which is written with a single write operation when flushed.
+    """
+
+    def __init__(self, env_var):
+        self.env_var = env_var
+        self.chunks = []
+        self._lock = threading.Lock()
+
+    def add(self, txt):
+        """Add specified text to buffer."""
+        with self._lock:
+            self.chunks.append(txt.encode('utf-8'))
+
+    def flush(self):
+        """
+        Append buffered text to file, using a single write operation.
+
+        If writing fails, data that was not written yet is kept in the buffer.
+        """
+        with self._lock:
+            if not self.chunks:
+                return
+
+            data = b''.join(self.chunks)
+            try:
+                fd = os.open(get_env_var(self.env_var), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    # a single write is used, unless the OS only writes part of the data
+                    while data:
+                        data = data[os.write(fd, data):]
+                finally:
+                    os.close(fd)
+            finally:
+                self.chunks = [data] if data else []
+
+
+_BUFFERS = {
+    GITHUB_ENV: _BufferedFile(GITHUB_ENV),
+    GITHUB_OUTPUT: _BufferedFile(GITHUB_OUTPUT),
+    GITHUB_STEP_SUMMARY: _BufferedFile(GITHUB_STEP_SUMMARY),
+}
+
+
+def _format_name_value(name, value):
+    """
+    Format name & value pair as expected in $GITHUB_OUTPUT and $GITHUB_ENV files.
+
+    Values that span multiple lines are enclosed by a random delimiter that does not occur in the value.
+    """
+    if not isinstance(value, string_types):
+        value = json.dumps(value)
+
+    if not name or '=' in name or '\n' in name or '\r' in name:
+        raise ValueError("Invalid name: %s" % name)
+
+    if '\n' in value or '\r' in value:
+        delimiter = 'ghadelimiter_%s' % uuid.uuid4()
+        if delimiter in value:
+            raise ValueError("Delimiter %s occurs in value for %s" % (delimiter, name))
+        res = '%s<<%s\n%s\n%s\n' % (name, delimiter, value, delimiter)
+    else:
+        res = '%s=%s\n' % (name, value)
+
+    return res
+
+
+def set_output(name, value):
+    """
+    Set output for current step (via $GITHUB_OUTPUT).
+
+    Outputs are buffered, and written when flush_outputs is called (or at exit).
+    Values that are not strings are serialized to JSON.
+    """
+    _BUFFERS[GITHUB_OUTPUT].add(_format_name_value(name, value))
+
+
+def set_env_var(name, value):
+    """
+    Set environment variable for subsequent steps (via $GITHUB_ENV), as well as for the current process.
+
+    Environment variables are buffered, and written when flush_outputs is called (or at exit).
+    Values that are not strings are serialized to JSON.
+    """
+    txt = _format_name_value(name, value)
+    _BUFFERS[GITHUB_ENV].add(txt)
+    os.environ[name] = value if isinstance(value, string_types) else json.dumps(value)
+
+
+def add_step_summary(markdown):
+    """
+    Add Markdown text to summary of current step (via $GITHUB_STEP_SUMMARY).
+
+    Summary is buffered, and written when flush_outputs is called (or at exit).
+    """
+    _BUFFERS[GITHUB_STEP_SUMMARY].add(markdown + '\n')
+
+
+def flush_outputs():
+    """
+    Write buffered outputs, environment variables and step summary, using a single write per file.
+
+    All files are written, even if writing one of them fails (for example because it is not defined);
+    an OSError listing all failures is raised afterwards, and data that was not written is kept in the buffers.
+    """
+    errors = []
+    for env_var in sorted(_BUFFERS):
+        try:
+            _BUFFERS[env_var].flush()
+        except EnvironmentError as err:
+            errors.append("%s: %s" % (env_var, err))
+
+    if errors:
+        raise OSError("Failed to write buffered data: %s" % '; '.join(errors))
+
+
+atexit.register(flush_outputs)
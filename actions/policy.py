@@ -0,0 +1,266 @@
+import copy
+import random
+import threading
+import time
+
+try:
+    from queue import Empty, Queue
+except ImportError:
+    from Queue import Empty, Queue  # Python 2
+
+from github import GithubException
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+
+# HTTP status codes for which a failed request is worth retrying
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RequestTimeoutError(RuntimeError):
+    """
+    Raised when a call did not complete in time, either because its deadline was exceeded,
+    or because all attempts timed out. The last error encountered (if any) is available as 'last_error'.
+    """
+
+    def __init__(self, msg, last_error=None):
+        RuntimeError.__init__(self, msg)
+        self.last_error = last_error
+
+
+class _AttemptTimeout(RequestTimeoutError):
+    """Raised when a single attempt of a request did not complete in time."""
+    pass
+
+
+def is_retryable(err):
+    """Check whether the specified exception raised by a request is transient (and hence worth retrying)."""
+    if isinstance(err, (_AttemptTimeout, RequestsConnectionError, RequestsTimeout)):
+        res = True
+    elif isinstance(err, GithubException):
+        res = err.status in RETRYABLE_STATUS_CODES
+    else:
+        res = False
+
+    return res
+
+
+def _attempts_exhausted_error(err, attempts):
+    """Determine error to raise when all attempts failed, with specified error for the last attempt."""
+    if isinstance(err, _AttemptTimeout):
+        res = RequestTimeoutError("All %d attempts timed out" % attempts, last_error=err)
+    else:
+        res = err
+
+    return res
+
+
+class RequestPolicy(object):
+    """
+    Policy for GitHub API requests: a total deadline per call, a timeout per attempt,
+    retries with jittered exponential backoff, and (optionally) hedging of slow reads.
+    """
+
+    def __init__(self, deadline=60, attempt_timeout=15, max_attempts=4, backoff_base=0.5, backoff_max=8,
+                 hedge_after=None):
+        """
+        :param deadline: total time (in seconds) a call may take, including all retries
+        :param attempt_timeout: time (in seconds) a single attempt may take
+        :param max_attempts: maximum number of attempts per call
+        :param backoff_base: base delay (in seconds) for exponential backoff between attempts
+        :param backoff_max: maximum delay (in seconds) between attempts
+        :param hedge_after: time (in seconds) after which a duplicate request is sent for a slow read
+                            (None implies no hedging)
+        """
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        # time at which deadline of current call expires (set via start)
+        self.end = None
+
+    def start(self):
+        """
+        Start a call using this policy: return a copy of this policy for which the deadline starts now,
+        which is shared by all requests made with it. If a call was already started, this policy is returned.
+        """
+        if self.end is None:
+            res = copy.copy(self)
+            res.end = time.time() + self.deadline
+        else:
+            res = self
+
+        return res
+
+    def backoff(self, attempt):
+        """Determine delay before next attempt, using exponential backoff with full jitter."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _run_attempts(self, attempt_fn, find_existing=None):
+        """
+        Run attempts via specified function until one succeeds, a non-retryable error occurs,
+        the maximum number of attempts is reached, or the deadline is exceeded.
+
+        :param attempt_fn: function to perform a single attempt, which takes the attempt timeout as argument
+        :param find_existing: function to check whether a failed attempt did take effect after all,
+                              which returns the result of that attempt (or None) before every retry
+        """
+        end = time.time() + self.deadline if self.end is None else self.end
+
+        attempt, err, delay = 0, None, 0
+        while True:
+            if time.time() + delay >= end:
+                raise RequestTimeoutError("Deadline of %ss exceeded after %d attempt(s), last error: %s"
+                                          % (self.deadline, attempt, err), last_error=err)
+            time.sleep(delay)
+
+            if attempt and find_existing is not None:
+                res = find_existing()
+                if res is not None:
+                    return res
+
+            try:
+                return attempt_fn(min(self.attempt_timeout, end - time.time()))
+            except Exception as attempt_err:
+                err = attempt_err
+                if not is_retryable(err):
+                    raise
+
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    raise _attempts_exhausted_error(err, attempt)
+
+                delay = self.backoff(attempt - 1)
+
+    def _call_with_timeout(self, function, args, kwargs, timeout):
+        """
+        Call specified function in a worker thread, and wait for at most the specified timeout for the result.
+        If hedging is enabled, a duplicate call is started when the first one is slow;
+        the first successful result is returned.
+        """
+        results = Queue()
+
+        def worker():
+            try:
+                results.put((True, function(*args, **kwargs)))
+            except Exception as err:
+                results.put((False, err))
+
+        def start_worker():
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        start = time.time()
+        end = start + timeout
+        if self.hedge_after is None or self.hedge_after >= timeout:
+            hedge_at = None
+        else:
+            hedge_at = start + self.hedge_after
+
+        start_worker()
+        pending = 1
+        err = None
+        while pending:
+            wait_until = end if hedge_at is None else hedge_at
+            try:
+                ok, res = results.get(timeout=max(wait_until - time.time(), 0))
+            except Empty:
+                if hedge_at is None:
+                    raise _AttemptTimeout("No response received within %.2fs" % timeout)
+                # first request is slow, send a duplicate one
+                start_worker()
+                pending += 1
+                hedge_at = None
+                continue
+
+            pending -= 1
+            if ok:
+                return res
+            err = res
+
+        raise err
+
+    def read(self, function, *args, **kwargs):
+        """
+        Perform an idempotent read request via specified function, using this policy.
+
+        Each attempt is subject to the attempt timeout, and may be hedged.
+        """
+        def attempt(timeout):
+            return self._call_with_timeout(function, args, kwargs, timeout)
+
+        return self._run_attempts(attempt)
+
+    def stream(self, function, *args, **kwargs):
+        """
+        Perform an idempotent streaming request (like a download) via specified function, using this policy.
+
+        Attempts are retried like reads, but are not subject to the attempt timeout (nor hedged),
+        since transferring a large response may take a while;
+        the client that is used by the function should enforce a timeout while waiting for data.
+        """
+        def attempt(_):
+            return function(*args, **kwargs)
+
+        return self._run_attempts(attempt)
+
+    def write(self, function, *args, **kwargs):
+        """
+        Perform a non-idempotent write request via specified function, using this policy.
+
+        Attempts are never hedged nor abandoned while in flight, since that could result in duplicate writes;
+        a timeout per attempt should be enforced by the client that is used by the function.
+        Before every retry, the 'find_existing' function (if specified) is used to check whether a failed
+        attempt did take effect after all, in which case its result is returned rather than retrying.
+        """
+        find_existing = kwargs.pop('find_existing', None)
+
+        def attempt(_):
+            return function(*args, **kwargs)
+
+        return self._run_attempts(attempt, find_existing=find_existing)
+
+
+class BudgetExhaustedError(RuntimeError):
+    """Raised when a budget of API requests is exhausted."""
+    pass
+
+
+class RateLimitBudget(object):
+    """
+    Budget of API requests that can be shared by concurrent workers (and across calls),
+    to ensure that together they stay within the rate limit.
+    """
+
+    def __init__(self, requests):
+        """
+        :param requests: number of API requests that may be made
+        """
+        self.remaining = requests
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        """Try to acquire specified number of requests from budget, return whether or not that was possible."""
+        with self._lock:
+            if self.remaining < count:
+                res = False
+            else:
+                self.remaining -= count
+                res = True
+
+        return res
+
+
+DEFAULT_REQUEST_POLICY = RequestPolicy()
+
+
+def start_call(policy=None):
+    """
+    Start a call using specified request policy (DEFAULT_REQUEST_POLICY if None),
+    so all requests made as part of that call share a single deadline.
+    """
+    if policy is None:
+        policy = DEFAULT_REQUEST_POLICY
+
+    return policy.start()
@@ -0,0 +1,268 @@
+import warnings
+
+from actions.constants import PUSH
+from actions.event import get_event_data, get_event_name
+from actions.issues import RATE_LIMIT_RESERVE, _get_github, _get_repo
+from actions.policy import DEFAULT_REQUEST_POLICY, BudgetExhaustedError, RateLimitBudget, start_call
+
+# maximum number of commits included in push event data
+# see https://docs.github.com/en/webhooks/webhook-events-and-payloads#push
+PUSH_COMMITS_LIMIT = 2048
+
+# SHA used in push event data for a branch that was created or deleted
+NULL_SHA = '0' * 40
+
+# number of commits per page when paging through compare API
+COMPARE_PER_PAGE = 100
+
+# number of changed files per page when paging through files changed by a commit
+COMMIT_FILES_PER_PAGE = 100
+
+# maximum number of changed files that is listed for a single commit
+# see https://docs.github.com/en/rest/commits/commits#get-a-commit
+COMMIT_FILES_LIMIT = 3000
+
+
+def push_context():
+    """Check if current workflow was triggered by a push."""
+    return get_event_name() == PUSH
+
+
+def _get_push_event_data():
+    """Get event data for push that triggered current workflow."""
+    if not push_context():
+        raise RuntimeError("Current workflow was not triggered by a push!")
+
+    return get_event_data()
+
+
+def push_truncated():
+    """
+    Check whether list of commits in event data for push that triggered current workflow is truncated,
+    and can be completed via the compare API.
+    """
+    event_data = _get_push_event_data()
+
+    nr_commits = len(event_data['commits'])
+    truncated = nr_commits >= PUSH_COMMITS_LIMIT or event_data.get('size', nr_commits) > nr_commits
+
+    # compare API can not be used if branch was created or deleted by push
+    if NULL_SHA in (event_data['before'], event_data['after']):
+        if truncated:
+            warnings.warn("List of %d commits in push event data is truncated, but can not be completed "
+                          "since branch was created or deleted by push" % nr_commits)
+        res = False
+    else:
+        res = truncated
+
+    return res
+
+
+def _request_within_budget(budget, requester, url, parameters):
+    """Perform GET request for specified URL via specified requester, if specified budget (if any) allows it."""
+    if budget is not None and not budget.acquire():
+        raise BudgetExhaustedError("Budget of API requests is exhausted, not requesting %s" % url)
+
+    return requester.requestJsonAndCheck('GET', url, parameters=parameters)
+
+
+def _iter_compare_pages(per_page=COMPARE_PER_PAGE, repo=None, policy=None, budget=None):
+    """
+    Generator that yields pages of comparison between commits before and after push that triggered current workflow.
+
+    Pages are only requested when needed, so only a single page is kept in memory at any time.
+    Requests are charged to specified budget (if any).
+    """
+    if policy is None:
+        policy = DEFAULT_REQUEST_POLICY
+
+    event_data = _get_push_event_data()
+    if repo is None:
+        repo = policy.read(_get_repo, policy=policy)
+    url = '%s/compare/%s...%s' % (repo.url, event_data['before'], event_data['after'])
+
+    page = 1
+    while True:
+        parameters = {'page': page, 'per_page': per_page}
+        _, data = policy.read(_request_within_budget, budget, repo._requester, url, parameters)
+        yield data
+
+        if page * per_page >= data['total_commits'] or not data['commits']:
+            break
+        page += 1
+
+
+def _commit_from_compare(commit):
+    """Convert commit in compare API response to format used for commits in push event data."""
+    return {
+        'id': commit['sha'],
+        'message': commit['commit']['message'],
+        'timestamp': commit['commit']['author']['date'],
+        'author': {
+            'name': commit['commit']['author']['name'],
+            'email': commit['commit']['author']['email'],
+            'username': (commit.get('author') or {}).get('login'),
+        },
+        'url': commit['html_url'],
+    }
+
+
+def get_push_commits(per_page=COMPARE_PER_PAGE, policy=None):
+    """
+    Generator that yields commits for push that triggered current workflow (in push event data format).
+
+    Commits included in the push event data are yielded first;
+    if that list is truncated, the remaining commits are obtained by paging through the compare API.
+
+    :param per_page: number of commits per page when paging through compare API
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None), its deadline applies to the whole iteration
+    """
+    event_data = _get_push_event_data()
+    policy = start_call(policy)
+
+    seen = set()
+    for commit in event_data['commits']:
+        seen.add(commit['id'])
+        yield commit
+
+    if push_truncated():
+        for data in _iter_compare_pages(per_page=per_page, policy=policy):
+            for commit in data['commits']:
+                if commit['sha'] not in seen:
+                    yield _commit_from_compare(commit)
+
+
+def _iter_commit_files(repo, sha, policy, budget):
+    """
+    Generator that yields files changed by commit with specified SHA (as returned by the API),
+    requesting one page of changed files at a time (charged to specified budget).
+    """
+    url = '%s/commits/%s' % (repo.url, sha)
+
+    page, count = 1, 0
+    while True:
+        parameters = {'page': page, 'per_page': COMMIT_FILES_PER_PAGE}
+        _, data = policy.read(_request_within_budget, budget, repo._requester, url, parameters)
+        files = data.get('files', [])
+        for changed_file in files:
+            yield changed_file
+
+        count += len(files)
+        if len(files) < COMMIT_FILES_PER_PAGE:
+            break
+        page += 1
+
+    if count >= COMMIT_FILES_LIMIT:
+        warnings.warn("List of files changed by commit %s is truncated at %d files" % (sha, count))
+
+
+def _file_changes_from_payload(commit):
+    """Return list of (filename, status) tuples for files changed by specified commit in push event data."""
+    return [(filename, status) for status in ['added', 'removed', 'modified'] for filename in commit.get(status, [])]
+
+
+def _file_changes_from_api(changed_file):
+    """
+    Return list of (filename, status) tuples for specified changed file as returned by the API,
+    using the statuses of push event data (added, removed, modified).
+    """
+    filename, status = changed_file['filename'], changed_file['status']
+    if status in ('added', 'copied'):
+        res = [(filename, 'added')]
+    elif status == 'removed':
+        res = [(filename, 'removed')]
+    elif status == 'renamed':
+        res = [(changed_file['previous_filename'], 'removed'), (filename, 'added')]
+    elif status == 'unchanged':
+        res = []
+    else:
+        # 'modified' or 'changed'
+        res = [(filename, 'modified')]
+
+    return res
+
+
+def _merge_file_change(changes, filename, status):
+    """
+    Merge change of file into specified dict, which tracks for every file
+    whether it existed before the first and after the last commit that changed it.
+    """
+    if filename in changes:
+        existed_before = changes[filename][0]
+    else:
+        existed_before = status != 'added'
+    changes[filename] = (existed_before, status != 'removed')
+
+
+def _iter_compare_file_changes(event_data, budget, policy):
+    """
+    Generator that yields (filename, status) tuples for files changed by commits listed by the compare API,
+    using the push event data for commits included in it, and requesting the changed files for other commits.
+    """
+    payload_commits = dict((commit['id'], commit) for commit in event_data['commits'])
+    gh = _get_github(policy=policy)
+    repo = policy.read(_get_repo, gh=gh)
+    if budget is None:
+        budget = RateLimitBudget(gh.rate_limiting[0] - RATE_LIMIT_RESERVE)
+
+    for data in _iter_compare_pages(repo=repo, policy=policy, budget=budget):
+        for commit in data['commits']:
+            if commit['sha'] in payload_commits:
+                for change in _file_changes_from_payload(payload_commits[commit['sha']]):
+                    yield change
+            else:
+                for changed_file in _iter_commit_files(repo, commit['sha'], policy, budget):
+                    for change in _file_changes_from_api(changed_file):
+                        yield change
+
+
+def _iter_push_file_changes(budget, policy):
+    """
+    Generator that yields (filename, status) tuples for files changed by commits of push
+    that triggered current workflow, in order of commits.
+    """
+    event_data = _get_push_event_data()
+
+    if push_truncated():
+        for change in _iter_compare_file_changes(event_data, budget, policy):
+            yield change
+    else:
+        for commit in event_data['commits']:
+            for change in _file_changes_from_payload(commit):
+                yield change
+
+
+def get_push_changed_files(net=False, budget=None, policy=None):
+    """
+    Generator that yields files changed by push that triggered current workflow, as (filename, status) tuples,
+    with status 'added', 'removed' or 'modified'.
+
+    By default, changes are streamed commit by commit (in order of commits), so a file that was changed
+    by multiple commits is yielded multiple times. If net changes are requested, changes by subsequent commits
+    are merged, so the status reflects the net change by the whole push: a file that was added and removed again
+    is not included, a file that was removed and added again is modified. This requires keeping track of all
+    changed files, so they are only yielded (in sorted order) once all commits are processed.
+
+    If the list of commits in the push event data is truncated, commits are obtained via the compare API,
+    and the files changed by commits that are not included in the push event data are requested per commit
+    (since the compare API lists at most 300 changed files). These requests are charged to a budget of
+    API requests; BudgetExhaustedError is raised when it is exhausted.
+
+    :param net: yield net changes by whole push rather than changes per commit
+    :param budget: RateLimitBudget for API requests (if None, remaining rate limit minus a reserve is used)
+    :param policy: request policy to use (DEFAULT_REQUEST_POLICY if None), its deadline applies to the whole iteration
+    """
+    policy = start_call(policy)
+
+    if net:
+        changes = {}
+        for filename, status in _iter_push_file_changes(budget, policy):
+            _merge_file_change(changes, filename, status)
+
+        net_statuses = {(False, True): 'added', (True, False): 'removed', (True, True): 'modified'}
+        for filename in sorted(changes):
+            if changes[filename] in net_statuses:
+                yield (filename, net_statuses[changes[filename]])
+    else:
+        for change in _iter_push_file_changes(budget, policy):
+            yield change
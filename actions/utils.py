@@ -1,4 +1,5 @@
 import os
+import threading
 
 from actions.constants import GITHUB_TOKEN
 
@@ -48,3 +49,16 @@ def get_github_token():
     Get GitHub token provided by GitHub Actions (via $GITHUB_TOKEN).
     """
     return get_env_var(GITHUB_TOKEN)
+
+
+def run_workers(worker, workers, *args):
+    """
+    Run specified worker function (with specified arguments) in specified number of concurrent threads,
+    and wait until all of them are done.
+    """
+    threads = [threading.Thread(target=worker, args=args) for _ in range(max(workers, 1))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
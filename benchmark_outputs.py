@@ -0,0 +1,61 @@
+"""
+Benchmark for writing step outputs & summary: opening, appending to and closing the files for every value,
+versus buffering values and writing them with a single write per file (via actions.outputs).
+
+Usage: python benchmark_outputs.py [<number of values>]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from actions.outputs import add_step_summary, flush_outputs, set_output
+
+
+def write_per_value(output_path, summary_path, count):
+    """Open, append to and close output & summary files for every value."""
+    for idx in range(count):
+        with open(output_path, 'a') as fp:
+            fp.write('output%d=value %d\n' % (idx, idx))
+        with open(summary_path, 'a') as fp:
+            fp.write('* item %d\n' % idx)
+
+
+def write_buffered(count):
+    """Buffer outputs & summary, and write them with a single write per file."""
+    for idx in range(count):
+        set_output('output%d' % idx, 'value %d' % idx)
+        add_step_summary('* item %d' % idx)
+    flush_outputs()
+
+
+def main(args):
+    count = int(args[0]) if args else 10000
+    tmpdir = tempfile.mkdtemp()
+    try:
+        timings = []
+        for label in ['per value', 'buffered']:
+            output_path = os.path.join(tmpdir, label.replace(' ', '_') + '_output.txt')
+            summary_path = os.path.join(tmpdir, label.replace(' ', '_') + '_summary.md')
+            os.environ['GITHUB_OUTPUT'] = output_path
+            os.environ['GITHUB_STEP_SUMMARY'] = summary_path
+
+            start = time.time()
+            if label == 'per value':
+                write_per_value(output_path, summary_path, count)
+            else:
+                write_buffered(count)
+            timings.append((label, time.time() - start))
+
+            with open(output_path) as fp:
+                assert len(fp.readlines()) == count
+
+        for label, timing in timings:
+            print("%s: %.3fs for %d outputs and summary lines" % (label, timing, count))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
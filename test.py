@@ -1,13 +1,35 @@
 import copy
+import io
 import json
 import os
 import pytest
+import re
+import tempfile
+import threading
+import time
+import zipfile
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # Python 2
+    from SocketServer import ThreadingMixIn
+
+from github import GithubException
 
 import actions.issues
+import actions.logs
+import actions.push
 from actions.constants import STATUS_SUCCESS
 from actions.event import get_event_data, get_event_trigger, triggered_by
 from actions.issues import get_issue_comments, get_label_names, get_milestone_title, get_pr_review_comments
 from actions.issues import get_pr_status, issue_or_pr_context, pr_context, post_comment
+from actions.issues import CLEANUP_DELETE, CLEANUP_MINIMIZE, clean_up_comments
+from actions.logs import search_run_logs
+from actions.outputs import add_step_summary, flush_outputs, set_env_var, set_output
+from actions.policy import BudgetExhaustedError, RateLimitBudget, RequestPolicy, RequestTimeoutError
+from actions.push import get_push_changed_files, get_push_commits, push_context, push_truncated
 from actions.utils import get_env_var, get_github_token
 
 TEST_EVENT_NAME = 'issue_comment'
@@ -35,6 +57,11 @@ TEST_EVENT_DATA = {
 }
 
 
+class MockedPaginatedList(list):
+    def get_page(self, page):
+        return self[page * 30:(page + 1) * 30]
+
+
 class MockedComment(object):
     def __init__(self, body):
         self.body = body
@@ -63,12 +90,12 @@ class MockedIssue(object):
         return txt
 
     def get_comments(self):
-        return [MockedComment(c) for c in ["hello world", "this is a comment"]]
+        return MockedPaginatedList([MockedComment(c) for c in ["hello world", "this is a comment"]])
 
 
 class MockedPR(object):
     def get_comments(self):
-        return [MockedComment('lgtm')]
+        return MockedPaginatedList([MockedComment('lgtm')])
 
     @property
     def head(self):
@@ -92,13 +119,180 @@ class MockedRepo(object):
 
 
 class MockedGithub(object):
-    def __init__(self, token):
+    def __init__(self, token, **kwargs):
         pass
 
     def get_repo(self, repo_name):
         return MockedRepo()
 
 
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeGitHubAPI(object):
+    """
+    Local server that mimics (part of) the GitHub API for the test repository,
+    and which can inject latency and errors.
+    """
+    repo_path = '/repos/boegel/py-github-actions'
+
+    def __init__(self):
+        # list of (delay, status, processed) faults to inject in subsequent requests, per (method, path);
+        # if 'processed' is True, the request takes effect before the error status is returned (lost response)
+        self.faults = {}
+        self.requests = []
+        self.comments = []
+        self.minimized = []
+        # commits for comparison between any two commits, and files changed by commits (per SHA)
+        self.compare_commits = []
+        self.commit_files = {}
+        # zipped logs for workflow run with ID 42
+        self.run_logs = None
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                api.handle(self, 'GET')
+
+            def do_POST(self):
+                api.handle(self, 'POST')
+
+            def do_DELETE(self):
+                api.handle(self, 'DELETE')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def count(self, method, path):
+        """Count number of requests received for specified method and path (relative to repository)."""
+        return self.requests.count((method, self.repo_path + path))
+
+    def add_comment(self, body, login, created_at):
+        """Add comment to test issue."""
+        comment_id = max([c['id'] for c in self.comments] + [0]) + 1
+        comment = {
+            'id': comment_id,
+            'node_id': 'IC_%d' % comment_id,
+            'url': self.url + self.repo_path + '/issues/comments/%d' % comment_id,
+            'body': body,
+            'user': {'login': login},
+            'created_at': created_at,
+        }
+        self.comments.append(comment)
+        return comment
+
+    def process(self, method, path, query, body):
+        """
+        Process request, return status and response data
+        (raw bytes for downloads, location for redirects).
+        """
+        repo_url = self.url + self.repo_path
+        status, data = 200, None
+        if path == '/user':
+            data = {'login': 'github-actions[bot]'}
+        elif path == self.repo_path:
+            data = {'full_name': 'boegel/py-github-actions', 'url': repo_url}
+        elif path == self.repo_path + '/pulls/123':
+            data = {'number': 123, 'head': {'sha': 'sha123'}, 'url': repo_url + '/pulls/123'}
+        elif path == self.repo_path + '/commits/sha123':
+            data = {'sha': 'sha123', 'url': repo_url + '/commits/sha123'}
+        elif path == self.repo_path + '/commits/sha123/status':
+            data = {'state': STATUS_SUCCESS}
+        elif path == self.repo_path + '/issues/123':
+            data = {'number': 123, 'url': repo_url + '/issues/123'}
+        elif path == self.repo_path + '/issues/123/comments':
+            if method == 'POST':
+                comment = self.add_comment(json.loads(body)['body'], 'github-actions[bot]', '2020-01-01T00:00:00Z')
+                status, data = 201, comment
+            else:
+                page, per_page = int(query.get('page', 1)), int(query.get('per_page', 30))
+                data = self.comments[(page - 1) * per_page:page * per_page]
+        elif path.startswith(self.repo_path + '/issues/comments/') and method == 'DELETE':
+            comment_id = int(path.split('/')[-1])
+            if comment_id in [c['id'] for c in self.comments]:
+                self.comments = [c for c in self.comments if c['id'] != comment_id]
+                status, data = 204, None
+        elif path.startswith(self.repo_path + '/compare/'):
+            page, per_page = int(query.get('page', 1)), int(query.get('per_page', 250))
+            data = {
+                'total_commits': len(self.compare_commits),
+                'commits': self.compare_commits[(page - 1) * per_page:page * per_page],
+            }
+        elif path == self.repo_path + '/actions/runs/42/logs' and self.run_logs is not None:
+            status, data = 302, self.url + '/download/logs.zip'
+        elif path == '/download/logs.zip':
+            data = self.run_logs
+        elif path.startswith(self.repo_path + '/commits/') and path.split('/')[-1] in self.commit_files:
+            page, per_page = int(query.get('page', 1)), int(query.get('per_page', 300))
+            files = self.commit_files[path.split('/')[-1]]
+            data = {'sha': path.split('/')[-1], 'files': files[(page - 1) * per_page:page * per_page]}
+        elif path == '/graphql':
+            node_id = json.loads(body)['variables']['id']
+            self.minimized.append(node_id)
+            data = {'data': {'minimizeComment': {'minimizedComment': {'isMinimized': True}}}}
+        if data is None and status != 204:
+            status, data = 404, {'message': 'Not Found'}
+
+        return status, data
+
+    def handle(self, handler, method):
+        path, _, query = handler.path.partition('?')
+        query = dict(item.split('=', 1) for item in query.split('&') if item)
+        self.requests.append((method, path))
+        body = handler.rfile.read(int(handler.headers.get('Content-Length') or 0))
+
+        faults = self.faults.get((method, path))
+        delay, error_status, processed = faults.pop(0) if faults else (0, None, False)
+        time.sleep(delay)
+
+        if error_status is None or processed:
+            status, data = self.process(method, path, query, body)
+        if error_status is not None:
+            status, data = error_status, {'message': 'injected error'}
+
+        headers = {'Content-Type': 'application/json'}
+        if status == 302:
+            headers['Location'] = data
+            payload = b''
+        elif isinstance(data, bytes):
+            headers['Content-Type'] = 'application/zip'
+            payload = data
+        else:
+            payload = b'' if data is None else json.dumps(data).encode('utf-8')
+
+        handler.send_response(status)
+        for key in sorted(headers):
+            handler.send_header(key, headers[key])
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.send_header('X-RateLimit-Remaining', '5000')
+        handler.send_header('X-RateLimit-Limit', '5000')
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope='function')
+def fake_github_api(monkeypatch, tmpdir):
+    """Local fake GitHub API server, with test event data and $GITHUB_TOKEN in place."""
+    api = FakeGitHubAPI()
+    install_test_event_data(monkeypatch, tmpdir)
+    monkeypatch.setenv('GITHUB_API_URL', api.url)
+    monkeypatch.setenv('GITHUB_TOKEN', 'thisisjustatest')
+    yield api
+    api.stop()
+
+
 @pytest.fixture(scope='function', autouse=True)
 def clear_caches():
     get_event_data.clear_cache()
@@ -332,13 +526,513 @@ def test_post_comment(monkeypatch, tmpdir):
         post_comment("this is just a test")
 
     monkeypatch.setenv('GITHUB_TOKEN', 'thisisjustatest')
+    # hidden marker with unique key is added to posted comment
     txt = "this is just a test"
-    assert(post_comment(txt) == txt)
+    res = post_comment(txt)
+    assert(re.match(r'^this is just a test\n\n<!-- idempotency:[0-9a-f-]{36} -->$', res))
+    assert(post_comment(txt) != res)
 
     txt = "Replying to comment '%(comment_body)s' sent by @%(sender_login)s"
-    assert(post_comment(txt) == "Replying to comment 'testing, 1, 2, 3' sent by @boegel")
+    assert(post_comment(txt).startswith("Replying to comment 'testing, 1, 2, 3' sent by @boegel\n\n<!-- "))
 
     # check what happens when unknown templates are used
     for txt in ["What if we use an %(unknown_template_value)s?", "replying to @%(sender_login)s: %(foobar)s"]:
         with pytest.raises(KeyError):
             post_comment(txt)
+
+
+def test_request_policy_retries(fake_github_api):
+    """Test retrying of failed requests with request policy."""
+    api = fake_github_api
+    policy = RequestPolicy(backoff_base=0.01)
+
+    # transient errors are retried
+    api.faults[('GET', api.repo_path + '/pulls/123')] = [(0, 502, False)]
+    api.faults[('GET', api.repo_path + '/commits/sha123/status')] = [(0, 503, False), (0, 500, False)]
+    assert(get_pr_status(policy=policy) == STATUS_SUCCESS)
+    # each attempt starts from scratch, so 4 attempts were required
+    assert(api.count('GET', '/pulls/123') == 4)
+    assert(api.count('GET', '/commits/sha123/status') == 3)
+
+    # number of attempts is limited
+    api.requests = []
+    api.faults[('GET', api.repo_path)] = [(0, 502, False)] * 5
+    with pytest.raises(GithubException):
+        get_pr_status(policy=policy)
+    assert(api.count('GET', '') == 4)
+
+    # other errors are not retried
+    api.requests = []
+    api.faults[('GET', api.repo_path)] = [(0, 404, False)]
+    with pytest.raises(GithubException):
+        get_pr_status(policy=policy)
+    assert(api.count('GET', '') == 1)
+
+
+def test_request_policy_deadline(fake_github_api):
+    """Test per-attempt timeout and total deadline of request policy."""
+    api = fake_github_api
+
+    # slow attempt is abandoned after attempt timeout, and retried
+    api.faults[('GET', api.repo_path + '/issues/123')] = [(2, None, False)]
+    policy = RequestPolicy(attempt_timeout=0.3, backoff_base=0.01)
+    start = time.time()
+    assert(get_issue_comments(policy=policy) == [])
+    assert(time.time() - start < 1.5)
+    assert(api.count('GET', '/issues/123') == 2)
+
+    # attempt timeout applies to each page of comments, not to all comments together
+    for idx in range(40):
+        api.add_comment("comment %d" % idx, 'boegel', '2020-01-01T00:00:00Z')
+    api.requests = []
+    api.faults[('GET', api.repo_path + '/issues/123/comments')] = [(0.2, None, False)] * 2
+    assert(get_issue_comments(policy=policy) == ["comment %d" % idx for idx in range(40)])
+    assert(api.count('GET', '/issues/123/comments') == 2)
+
+    # deadline is enforced
+    api.faults[('GET', api.repo_path)] = [(2, None, False)] * 10
+    policy = RequestPolicy(deadline=0.5, attempt_timeout=0.2, max_attempts=10, backoff_base=0.01)
+    start = time.time()
+    with pytest.raises(RequestTimeoutError):
+        get_pr_status(policy=policy)
+    assert(time.time() - start < 1.5)
+    del api.faults[('GET', api.repo_path)]
+
+    # deadline applies to whole call, not to every page separately
+    for idx in range(40, 100):
+        api.add_comment("comment %d" % idx, 'boegel', '2020-01-01T00:00:00Z')
+    api.faults[('GET', api.repo_path + '/issues/123/comments')] = [(0.35, None, False)] * 4
+    policy = RequestPolicy(deadline=0.5, attempt_timeout=0.4, backoff_base=0.01)
+    start = time.time()
+    with pytest.raises(RequestTimeoutError):
+        get_issue_comments(policy=policy)
+    assert(time.time() - start < 1)
+
+    # all attempts timing out results in the same error
+    api.faults[('GET', api.repo_path + '/issues/123')] = [(1, None, False)] * 2
+    policy = RequestPolicy(attempt_timeout=0.2, max_attempts=2, backoff_base=0.01)
+    with pytest.raises(RequestTimeoutError):
+        get_issue_comments(policy=policy)
+
+
+def test_request_policy_hedging(fake_github_api):
+    """Test hedging of slow reads with request policy."""
+    api = fake_github_api
+
+    api.faults[('GET', api.repo_path + '/commits/sha123/status')] = [(2, None, False)]
+    policy = RequestPolicy(attempt_timeout=5, hedge_after=0.1)
+    start = time.time()
+    assert(get_pr_status(policy=policy) == STATUS_SUCCESS)
+    assert(time.time() - start < 1.5)
+    assert(api.count('GET', '/commits/sha123/status') == 2)
+
+
+def test_post_comment_idempotent(fake_github_api):
+    """Test that post_comment never posts a comment twice."""
+    api = fake_github_api
+    policy = RequestPolicy(backoff_base=0.01)
+    comments_path = api.repo_path + '/issues/123/comments'
+
+    def comment_bodies():
+        return [c['body'].split('\n\n<!-- idempotency:')[0] for c in api.comments]
+
+    # comment is posted again if failed attempt did not go through
+    api.faults[('POST', comments_path)] = [(0, 502, False)]
+    assert(post_comment("first test", policy=policy).body.startswith("first test\n\n<!-- idempotency:"))
+    assert(api.count('POST', '/issues/123/comments') == 2)
+    assert(comment_bodies() == ["first test"])
+
+    # comment is not posted again if failed attempt went through after all,
+    # also when checking for it fails temporarily
+    api.requests = []
+    api.faults[('POST', comments_path)] = [(0, 502, True)]
+    api.faults[('GET', comments_path)] = [(0, 503, False)]
+    assert(post_comment("second test", policy=policy).body.startswith("second test"))
+    assert(api.count('POST', '/issues/123/comments') == 1)
+    assert(comment_bodies() == ["first test", "second test"])
+
+    # an existing comment with the same text does not prevent posting the comment
+    api.requests = []
+    api.faults[('POST', comments_path)] = [(0, 502, False)]
+    post_comment("second test", policy=policy)
+    assert(api.count('POST', '/issues/123/comments') == 2)
+    assert(comment_bodies() == ["first test", "second test", "second test"])
+
+
+def test_clean_up_comments(fake_github_api, tmpdir):
+    """Test clean_up_comments function."""
+    api = fake_github_api
+    policy = RequestPolicy(backoff_base=0.01)
+
+    api.add_comment("<!-- bot:status --> old status", 'github-actions[bot]', '2000-01-01T00:00:00Z')
+    api.add_comment("lgtm", 'boegel', '2000-01-01T00:00:00Z')
+    api.add_comment("<!-- bot:status --> another old status", 'github-actions[bot]', '2000-01-02T00:00:00Z')
+    api.add_comment("<!-- bot:status --> new status", 'github-actions[bot]', '2999-01-01T00:00:00Z')
+
+    # at least one criterion must be specified, and action must be known
+    with pytest.raises(ValueError):
+        clean_up_comments(policy=policy)
+    with pytest.raises(ValueError):
+        clean_up_comments(marker='<!-- bot:status -->', action='hide', policy=policy)
+
+    # dry run only reports which comments would be cleaned up
+    report = clean_up_comments(authors=['github-actions[bot]'], older_than=3600, dry_run=True, policy=policy)
+    assert(report['selected'] == [1, 3])
+    assert(report['would_process'] == [1, 3])
+    assert(report['processed'] == [])
+    assert(api.minimized == [])
+
+    report = clean_up_comments(marker='<!-- bot:status -->', dry_run=True, policy=policy)
+    assert(report['selected'] == [1, 3, 4])
+
+    # minimize stale comments, and record progress in state file
+    state_path = str(tmpdir.join('cleanup_state.txt'))
+    api.faults[('POST', '/graphql')] = [(0, 502, False)]
+    report = clean_up_comments(marker='<!-- bot:status -->', older_than=3600, action=CLEANUP_MINIMIZE,
+                               state_path=state_path, policy=policy)
+    assert(report['processed'] == [1, 3])
+    assert(report['failed'] == {})
+    assert(sorted(api.minimized) == ['IC_1', 'IC_3'])
+    assert(sorted(open(state_path).read().split()) == ['1', '3'])
+
+    # cleanup is resumed, so already processed comments are not minimized again
+    report = clean_up_comments(marker='<!-- bot:status -->', state_path=state_path, workers=2, policy=policy)
+    assert(report['resumed'] == [1, 3])
+    assert(report['processed'] == [4])
+    assert(sorted(api.minimized) == ['IC_1', 'IC_3', 'IC_4'])
+
+    # deleting stale comments is limited by budget of API requests
+    report = clean_up_comments(marker='<!-- bot:status -->', action=CLEANUP_DELETE, budget=RateLimitBudget(2),
+                               policy=policy)
+    assert(report['selected'] == [1, 3, 4])
+    assert(len(report['processed']) == 2)
+    assert(len(report['skipped']) == 1)
+    assert(sorted(c['id'] for c in api.comments) == sorted([2] + report['skipped']))
+
+    report = clean_up_comments(marker='<!-- bot:status -->', action=CLEANUP_DELETE, policy=policy)
+    assert(len(report['processed']) == 1)
+    assert([c['id'] for c in api.comments] == [2])
+
+    # retries are also charged to budget of API requests;
+    # comments are selected from all pages of comments
+    for idx in range(40):
+        api.add_comment("<!-- bot:status --> status %d" % idx, 'github-actions[bot]', '2000-01-01T00:00:00Z')
+    stale_ids = [c['id'] for c in api.comments[1:]]
+    api.faults[('DELETE', api.repo_path + '/issues/comments/%d' % stale_ids[0])] = [(0, 502, False)]
+    budget = RateLimitBudget(40)
+    api.requests = []
+    report = clean_up_comments(marker='<!-- bot:status -->', action=CLEANUP_DELETE, budget=budget, policy=policy)
+    assert(report['selected'] == stale_ids)
+    assert(len(report['processed']) == 39)
+    assert(len(report['skipped']) == 1)
+    assert(budget.remaining == 0)
+
+    # each worker uses its own client, so every comment is deleted exactly once (apart from retries)
+    delete_paths = [path for method, path in api.requests if method == 'DELETE']
+    expected_ids = report['processed'] + [stale_ids[0]]
+    assert(sorted(delete_paths) == sorted(api.repo_path + '/issues/comments/%d' % i for i in expected_ids))
+
+    # comment that is not found at first attempt was not deleted by cleanup
+    first_id, second_id = report['skipped'][0], api.comments[-1]['id'] + 1
+    api.add_comment("<!-- bot:status --> one more", 'github-actions[bot]', '2000-01-01T00:00:00Z')
+    api.faults[('DELETE', api.repo_path + '/issues/comments/%d' % first_id)] = [(0, 404, False)]
+    # comment that is not found when retrying after a lost response was deleted by cleanup
+    api.faults[('DELETE', api.repo_path + '/issues/comments/%d' % second_id)] = [(0, 502, True)]
+    report = clean_up_comments(marker='<!-- bot:status -->', action=CLEANUP_DELETE, policy=policy)
+    assert(list(report['failed']) == [first_id])
+    assert(report['processed'] == [second_id])
+    assert(sorted(c['id'] for c in api.comments) == sorted([2, first_id]))
+
+
+def test_push(fake_github_api, monkeypatch, tmpdir):
+    """Test push helper functions."""
+    api = fake_github_api
+
+    # push helpers can only be used for push events
+    assert(push_context() is False)
+    with pytest.raises(RuntimeError):
+        list(get_push_commits())
+
+    def make_commit(idx, **kwargs):
+        commit = {'id': 'sha%d' % idx, 'message': 'commit %d' % idx}
+        commit.update(kwargs)
+        return commit
+
+    commits = [
+        make_commit(1, added=['README.md', 'setup.py']),
+        make_commit(2, modified=['README.md', 'test.py']),
+        make_commit(3, removed=['setup.py']),
+    ]
+    push_event_data = {
+        'ref': 'refs/heads/master',
+        'before': 'sha0',
+        'after': 'sha3',
+        'commits': commits,
+        'repository': TEST_EVENT_DATA['repository'],
+    }
+    install_test_event_data(monkeypatch, tmpdir, event_name='push', event_data=push_event_data)
+    get_event_data.clear_cache()
+
+    # commits & changed files are obtained from event data if list of commits is not truncated
+    assert(push_context())
+    assert(push_truncated() is False)
+    assert(list(get_push_commits()) == commits)
+    # changes are streamed per commit
+    assert(list(get_push_changed_files()) == [('README.md', 'added'), ('setup.py', 'added'),
+                                              ('README.md', 'modified'), ('test.py', 'modified'),
+                                              ('setup.py', 'removed')])
+    # net changes are merged: setup.py was added and removed again
+    assert(list(get_push_changed_files(net=True)) == [('README.md', 'added'), ('test.py', 'modified')])
+    assert(api.requests == [])
+
+    # compare API is used to obtain remaining commits & changed files if list of commits is truncated
+    for idx in range(1, 21):
+        api.compare_commits.append({
+            'sha': 'sha%d' % idx,
+            'html_url': 'https://github.com/boegel/py-github-actions/commit/sha%d' % idx,
+            'author': {'login': 'boegel'},
+            'commit': {
+                'message': 'commit %d' % idx,
+                'author': {'name': 'Kenneth Hoste', 'email': 'kenneth.hoste@ugent.be', 'date': '2020-01-01T00:00:00Z'},
+            },
+        })
+    api.commit_files = {
+        'sha4': [{'filename': 'tests/test_push.py', 'status': 'renamed', 'previous_filename': 'test.py'}],
+        'sha5': [{'filename': 'tmp.txt', 'status': 'added'}],
+        'sha6': [{'filename': 'tmp.txt', 'status': 'removed'}],
+        'sha7': [{'filename': 'LICENSE', 'status': 'removed'}],
+        'sha8': [{'filename': 'LICENSE', 'status': 'added'}],
+        'sha9': [{'filename': 'docs/%03d.md' % idx, 'status': 'added'} for idx in range(150)],
+    }
+    for idx in range(10, 21):
+        api.commit_files['sha%d' % idx] = []
+    push_event_data['after'] = 'sha20'
+    push_event_data['size'] = 20
+    install_test_event_data(monkeypatch, tmpdir, event_name='push', event_data=push_event_data)
+    get_event_data.clear_cache()
+
+    assert(push_truncated())
+
+    # pages are only requested when needed
+    push_commits = get_push_commits(per_page=5)
+    assert([next(push_commits)['id'] for _ in range(5)] == ['sha1', 'sha2', 'sha3', 'sha4', 'sha5'])
+    assert(api.count('GET', '/compare/sha0...sha20') == 1)
+    push_commits = list(push_commits)
+    assert([c['id'] for c in push_commits] == ['sha%d' % idx for idx in range(6, 21)])
+    assert(push_commits[0]['author']['username'] == 'boegel')
+    assert(api.count('GET', '/compare/sha0...sha20') == 4)
+
+    # files changed by commits not included in event data are obtained per commit (and page of changed files)
+    api.requests = []
+    expected_files = [('LICENSE', 'modified'), ('README.md', 'added')]
+    expected_files += [('docs/%03d.md' % idx, 'added') for idx in range(150)]
+    expected_files += [('test.py', 'removed'), ('tests/test_push.py', 'added')]
+    assert(list(get_push_changed_files(net=True)) == expected_files)
+    assert(api.count('GET', '/commits/sha3') == 0)
+    assert(api.count('GET', '/commits/sha4') == 1)
+    assert(api.count('GET', '/commits/sha9') == 2)
+
+    # changes per commit are streamed, so changed files are only requested when needed
+    api.requests = []
+    changes = get_push_changed_files()
+    assert([next(changes) for _ in range(6)] == [('README.md', 'added'), ('setup.py', 'added'),
+                                                 ('README.md', 'modified'), ('test.py', 'modified'),
+                                                 ('setup.py', 'removed'), ('test.py', 'removed')])
+    assert(api.count('GET', '/commits/sha4') == 1)
+    assert(api.count('GET', '/commits/sha5') == 0)
+    assert(len(list(changes)) == 155)
+
+    # requests are charged to budget of API requests: 1 page of commits, 4 pages of changed files
+    api.requests = []
+    changes = get_push_changed_files(budget=RateLimitBudget(5))
+    assert([next(changes) for _ in range(10)][-1] == ('LICENSE', 'removed'))
+    with pytest.raises(BudgetExhaustedError):
+        next(changes)
+    assert(api.count('GET', '/commits/sha8') == 0)
+
+    # warning is issued when list of files changed by a commit hits the limit of the API
+    monkeypatch.setattr(actions.push, 'COMMIT_FILES_LIMIT', 150)
+    with pytest.warns(UserWarning, match='sha9 is truncated'):
+        assert(list(get_push_changed_files(net=True)) == expected_files)
+
+    # compare API is not used if branch was created by push, a warning is issued if commits are truncated
+    push_event_data['before'] = '0' * 40
+    install_test_event_data(monkeypatch, tmpdir, event_name='push', event_data=push_event_data)
+    get_event_data.clear_cache()
+    with pytest.warns(UserWarning, match='can not be completed'):
+        assert(push_truncated() is False)
+
+
+def test_search_run_logs(fake_github_api, monkeypatch, tmpdir):
+    """Test search_run_logs function."""
+    api = fake_github_api
+    policy = RequestPolicy(backoff_base=0.01)
+    # logs are downloaded to a temporary file, which is removed afterwards
+    tmp_dir = tmpdir.mkdir('tmp')
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_dir))
+
+    logs = io.BytesIO()
+    with zipfile.ZipFile(logs, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        # full job logs are only scanned for jobs without logs for steps
+        zip_file.writestr('0_build.txt', "Run make\nerror: no space left on device\n")
+        zip_file.writestr('build/1_Set up job.txt', "2020-01-01T00:00:00Z Starting\n")
+        zip_file.writestr('build/2_Run make.txt', "2020-01-01T00:00:01Z Run make\n" * 1000 +
+                          "2020-01-01T00:00:02Z error: no space left on device\n")
+        zip_file.writestr('1_lint.txt', "\ufeffE501 line too long\nSegmentation fault (core dumped)\n")
+    api.run_logs = logs.getvalue()
+
+    # run ID is determined via $GITHUB_RUN_ID by default
+    monkeypatch.delenv('GITHUB_RUN_ID', raising=False)
+    with pytest.raises(OSError):
+        search_run_logs(['error'], policy=policy)
+
+    with pytest.raises(ValueError):
+        search_run_logs([], run_id=42, policy=policy)
+
+    patterns = {
+        'disk_full': r'no space left on device',
+        'segfault': r'Segmentation fault',
+        'error': r'error:',
+    }
+    api.faults[('GET', '/download/logs.zip')] = [(0, 502, False)]
+    monkeypatch.setenv('GITHUB_RUN_ID', '42')
+    matches = search_run_logs(patterns, workers=2, policy=policy)
+    expected = [
+        {
+            'job': 'build',
+            'step_number': 2,
+            'step': 'Run make',
+            'line_number': 1001,
+            'line': "2020-01-01T00:00:02Z error: no space left on device",
+            'pattern': 'disk_full',
+        },
+        {
+            'job': 'build',
+            'step_number': 2,
+            'step': 'Run make',
+            'line_number': 1001,
+            'line': "2020-01-01T00:00:02Z error: no space left on device",
+            'pattern': 'error',
+        },
+        {
+            'job': 'lint',
+            'step_number': None,
+            'step': None,
+            'line_number': 2,
+            'line': "Segmentation fault (core dumped)",
+            'pattern': 'segfault',
+        },
+    ]
+    assert(matches == expected)
+    assert(api.requests.count(('GET', '/download/logs.zip')) == 2)
+    assert(tmp_dir.listdir() == [])
+
+    # log files can also be scanned in current process
+    assert(search_run_logs(patterns, workers=1, policy=policy) == expected)
+
+    # patterns can also be specified as a list
+    matches = search_run_logs(['E501'], run_id=42, policy=policy)
+    assert([(m['job'], m['line_number'], m['line']) for m in matches] == [('lint', 1, "E501 line too long")])
+
+    def matched_lines(patterns):
+        matches = search_run_logs(patterns, run_id=42, policy=policy)
+        return sorted((m['pattern'], m['line_number']) for m in matches if m['job'] == 'lint')
+
+    # flags of compiled patterns are taken into account
+    assert(matched_lines([re.compile('SEGMENTATION', re.I), 'E501']) == [('E501', 1), ('SEGMENTATION', 2)])
+    patterns = [re.compile(r'E501  # line too long', re.X), 'fault']
+    assert(matched_lines(patterns) == [('E501  # line too long', 1), ('fault', 2)])
+
+    # inline flags are supported, also when pattern is not the first one
+    patterns = {'a_lint': 'E501', 'b_segfault': '(?i)segmentation FAULT'}
+    assert(matched_lines(patterns) == [('a_lint', 1), ('b_segfault', 2)])
+
+    # patterns using the same group names or backreferences are supported
+    patterns = [r'(?P<code>E\d+)', r'(?P<code>W\d+)', r'(\w)\1']
+    assert(matched_lines(patterns) == [(r'(?P<code>E\d+)', 1), (r'(\w)\1', 1)])
+    assert(actions.logs._compile_matcher(re.compile(p) for p in patterns) is None)
+
+    # errors for which retrying is not useful are raised immediately (e.g. logs not found)
+    with pytest.raises(GithubException):
+        search_run_logs(['error'], run_id=123, policy=policy)
+    assert(tmp_dir.listdir() == [])
+
+
+def test_outputs(monkeypatch, tmpdir):
+    """Test setting outputs, environment variables and step summary."""
+    output_path = str(tmpdir.join('output.txt'))
+    env_path = str(tmpdir.join('env.txt'))
+    summary_path = str(tmpdir.join('summary.md'))
+    monkeypatch.setenv('GITHUB_OUTPUT', output_path)
+    monkeypatch.setenv('GITHUB_ENV', env_path)
+    monkeypatch.setenv('GITHUB_STEP_SUMMARY', summary_path)
+    monkeypatch.delenv('TEST_OUTPUTS_VAR', raising=False)
+
+    # invalid names are rejected
+    for name in ['', 'foo=bar', 'foo\nbar']:
+        with pytest.raises(ValueError):
+            set_output(name, 'test')
+
+    set_output('result', 'success')
+    set_output('data', {'count': 3})
+    set_output('log', "line 1\nline 2")
+    set_env_var('TEST_OUTPUTS_VAR', 'test123')
+    add_step_summary("# Results")
+
+    # environment variable is set immediately in current process, but nothing is written until flush
+    assert(os.getenv('TEST_OUTPUTS_VAR') == 'test123')
+    assert(not any(os.path.exists(p) for p in [output_path, env_path, summary_path]))
+
+    flush_outputs()
+
+    lines = open(output_path).read().split('\n')
+    assert(lines[:2] == ['result=success', 'data={"count": 3}'])
+    assert(lines[2].startswith('log<<ghadelimiter_'))
+    delimiter = lines[2].split('<<')[1]
+    assert(lines[3:] == ['line 1', 'line 2', delimiter, ''])
+    assert(open(env_path).read() == 'TEST_OUTPUTS_VAR=test123\n')
+    assert(open(summary_path).read() == '# Results\n')
+
+    # buffers are cleared after flush, subsequent flush appends to files
+    add_step_summary("all good")
+    flush_outputs()
+    flush_outputs()
+    assert(open(summary_path).read() == '# Results\nall good\n')
+    assert(open(env_path).read() == 'TEST_OUTPUTS_VAR=test123\n')
+
+    # many outputs result in a single write per file
+    writes = []
+    orig_write = os.write
+
+    def counting_write(fd, data):
+        writes.append(fd)
+        return orig_write(fd, data)
+
+    for idx in range(3000):
+        set_output('output%d' % idx, 'value %d' % idx)
+        set_env_var('TEST_OUTPUTS_VAR', 'value %d' % idx)
+        add_step_summary("* item %d" % idx)
+
+    monkeypatch.setattr(os, 'write', counting_write)
+    flush_outputs()
+    monkeypatch.setattr(os, 'write', orig_write)
+
+    assert(len(writes) == 3)
+    assert(len(open(output_path).read().split('\n')) == 6 + 3000 + 1)
+    assert(open(summary_path).read().endswith("* item 2999\n"))
+
+    # all files are written even if one of them is not defined, data for that file is kept
+    monkeypatch.delenv('GITHUB_ENV')
+    set_output('result', 'failure')
+    set_env_var('TEST_OUTPUTS_VAR', 'test456')
+    add_step_summary("not so good")
+    with pytest.raises(OSError, match='GITHUB_ENV'):
+        flush_outputs()
+    assert(open(output_path).read().endswith('result=failure\n'))
+    assert(open(summary_path).read().endswith("not so good\n"))
+    assert(open(env_path).read().endswith('TEST_OUTPUTS_VAR=value 2999\n'))
+
+    monkeypatch.setenv('GITHUB_ENV', env_path)
+    flush_outputs()
+    assert(open(env_path).read().endswith('TEST_OUTPUTS_VAR=value 2999\nTEST_OUTPUTS_VAR=test456\n'))
+    assert(open(output_path).read().count('result=failure\n') == 1)